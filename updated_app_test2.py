@@ -1,10 +1,14 @@
+import gc
+import io
 import os
-import time
-import random
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 import joblib
+import numpy as np
 import pandas as pd
 import streamlit as st
 import plotly.express as px
+from warranty import decide_warranty
 
 # --------------------------
 # Paths
@@ -20,20 +24,88 @@ MODEL_DIR = "."
 RUL_MODEL_PATH = "RUL_pipeline.pkl"
 FAILURE_MODEL_PATH = "Failure_Probability_pipeline.pkl"
 
+# --------------------------
+# Simulated Live Sensor Ranges
+# --------------------------
+SENSOR_KEYS = [
+    "Battery_Voltage", "Battery_Current", "Battery_Temperature", "Motor_Temperature",
+    "Motor_Vibration", "Brake_Pad_Wear", "Tire_Pressure", "Ambient_Temperature"
+]
+SENSOR_LOWS = np.array([380, -50, 25, 50, 0.1, 0.1, 28, 20])
+SENSOR_HIGHS = np.array([420, 50, 40, 90, 2.0, 0.9, 36, 35])
+
+rng = np.random.default_rng()
+
+# --------------------------
+# Maintenance Chart Components
+# --------------------------
+# Service interval = avg RUL / divisor; Tires (divisor 0) use distance instead
+COMPONENTS = np.array(["Battery", "Brakes", "Tires", "Motor", "Cooling"])
+DIVISORS = np.array([3, 2, 0, 4, 5], dtype=np.float32)
+
+# Rows of the results table sent to the browser; the full table is offered as a download
+PREVIEW_ROWS = 1000
+
+# --------------------------
+# Warranty Decision
+# --------------------------
+# decide_warranty (see warranty.py) returns 0/1 per row; labels are applied at display time
+WARRANTY_LABELS = np.array(["❌ Rejected", "✅ Accepted"])
+
+# --------------------------
+# Optional scikit-learn Acceleration
+# --------------------------
+# Patch once per server, before the pipelines are unpickled, when Intel Extension for Scikit-learn
+# is installed. It does not patch StandardScaler or XGBoost, so the current pipelines are unaffected.
+@st.cache_resource(show_spinner=False)
+def patch_sklearn_once():
+    try:
+        from sklearnex import patch_sklearn
+    except ImportError:
+        return False
+    patch_sklearn()
+    return True
+
+patch_sklearn_once()
+
+# --------------------------
+# Shared Thread Pool
+# --------------------------
+# One pool for the whole server, shared by the cold-start model load and prediction
+@st.cache_resource(show_spinner=False)
+def get_pool():
+    return ThreadPoolExecutor(max_workers=os.cpu_count() or 4)
+
 # --------------------------
 # Load Models Safely
 # --------------------------
-@st.cache_resource
 def load_model(path):
     if os.path.exists(path):
         model = joblib.load(path)
         return model
     else:
-        st.sidebar.error(f"❌ Model not found: {path}")
         return None
 
-rul_model = load_model(RUL_MODEL_PATH)
-failure_model = load_model(FAILURE_MODEL_PATH)
+# Load both pipelines concurrently to overlap disk IO and unpickling on cold start;
+# later reruns get the cached pair without touching the pool
+@st.cache_resource(show_spinner=False)
+def load_models():
+    rul_future = get_pool().submit(load_model, RUL_MODEL_PATH)
+    failure_future = get_pool().submit(load_model, FAILURE_MODEL_PATH)
+    return rul_future.result(), failure_future.result()
+
+rul_model, failure_model = load_models()
+
+# Streamlit elements must be created from the script thread, not the loader threads
+for path, model in ((RUL_MODEL_PATH, rul_model), (FAILURE_MODEL_PATH, failure_model)):
+    if model is None:
+        st.sidebar.error(f"❌ Model not found: {path}")
+
+# Both predict calls release the GIL inside XGBoost, so run them side by side
+def predict_maintenance(model_input):
+    rul_future = get_pool().submit(rul_model.predict, model_input)
+    failure_future = get_pool().submit(failure_model.predict_proba, model_input)
+    return rul_future.result(), failure_future.result()[:, 1]
 
 # --------------------------
 # Streamlit Config
@@ -88,11 +160,92 @@ features = [
     "Distance_Traveled", "Idle_Time", "Route_Roughness"
 ]
 
-manual_input = pd.DataFrame([[soc/100, soh/100, battery_voltage, battery_current, battery_temp, charge_cycles,
+# Explicit CSV dtypes: the scaler casts to float anyway, and float keeps empty cells as NaN for XGBoost
+DTYPES = {f: "float32" for f in features}
+
+# Stream uploaded CSVs in fixed-size chunks so large telemetry files are never fully in memory
+CSV_CHUNK_ROWS = 50000
+
+def read_feature_csv(csv_file, **kwargs):
+    csv_file.seek(0)
+    return pd.read_csv(csv_file, dtype=DTYPES, usecols=features, **kwargs)
+
+manual_row = (soc/100, soh/100, battery_voltage, battery_current, battery_temp, charge_cycles,
     motor_temp, motor_vibration, motor_torque, motor_rpm, power_consumption,
     brake_wear/100, brake_pressure, reg_brake_eff, tire_pressure, tire_temp,
     suspension_load, ambient_temp, ambient_humidity, load_weight, driving_speed,
-    distance_traveled, idle_time, route_roughness]], columns=features)
+    distance_traveled, idle_time, route_roughness)
+
+# The pipelines were fitted on named columns, so keep one float32 frame per session
+# and overwrite its single row on each rerun instead of constructing a new DataFrame
+if "manual_input" not in st.session_state:
+    st.session_state.manual_input = pd.DataFrame(np.zeros((1, len(features)), dtype=np.float32), columns=features)
+manual_input = st.session_state.manual_input
+manual_input.iloc[0, :] = manual_row
+
+# --------------------------
+# Batch Prediction
+# --------------------------
+def predict_batches(manual_input, csv_file):
+    # Predict each batch separately instead of concatenating the CSV onto the manual row;
+    # yields (source, inputs, rul, failure) so callers never hold more than one CSV chunk
+    yield ("manual", manual_input, *predict_maintenance(manual_input))
+    if csv_file is not None:
+        for csv_chunk in read_feature_csv(csv_file, chunksize=CSV_CHUNK_ROWS):
+            csv_input = csv_chunk.reindex(columns=features)
+            # A header-only CSV yields an empty chunk, which the scaler rejects
+            if len(csv_input) == 0:
+                continue
+
+            # Telemetry logs repeat snapshots, so predict each distinct row once and scatter back
+            row_codes, _ = pd.factorize(pd.util.hash_pandas_object(csv_input, index=False))
+            _, first_rows = np.unique(row_codes, return_index=True)
+            unique_input = csv_input.iloc[first_rows]
+
+            csv_rul, csv_failure = predict_maintenance(unique_input)
+            yield "csv", csv_input, csv_rul[row_codes], csv_failure[row_codes]
+
+def predict_results(manual_input, csv_file):
+    rul_batches = []
+    failure_batches = []
+    for _, _, rul, failure in predict_batches(manual_input, csv_file):
+        rul_batches.append(rul)
+        failure_batches.append(failure)
+
+    rul_predictions = np.concatenate(rul_batches)
+    failure_predictions = np.concatenate(failure_batches)
+
+    claim_accepted, avg_rul, avg_failure = decide_warranty(rul_predictions, failure_predictions)
+    results = pd.DataFrame({
+        "RUL_days": rul_predictions,
+        "Failure_Probability": failure_predictions,
+        "Vehicle_Health": 1 - failure_predictions,
+        "Warranty_Claim_Accepted": WARRANTY_LABELS[claim_accepted],
+    })
+    return results, avg_rul, avg_failure
+
+# Full results download: each row carries its Source ("manual"/"csv"), its 1-based data row number
+# in the uploaded CSV, the input features and the predictions. Batches are written as they are
+# predicted, so only one CSV chunk is in memory next to the output text.
+# Only the preview is kept between reruns, so the first click re-parses and re-predicts the upload
+# on the download thread, reading a private view of it so it cannot race the script's reads.
+# The last payload is cached, keyed on the manual row and upload id, so repeat clicks are free.
+@st.cache_data(max_entries=1, show_spinner=False)
+def results_csv(manual_row, csv_file_id, _manual_input, _csv_file):
+    csv_file = io.BytesIO(_csv_file.getvalue()) if _csv_file is not None else None
+    output = io.StringIO()
+    for source, batch_input, rul, failure in predict_batches(_manual_input, csv_file):
+        claim_accepted, _, _ = decide_warranty(rul, failure)
+        batch_results = batch_input.assign(
+            RUL_days=rul,
+            Failure_Probability=failure,
+            Vehicle_Health=1 - failure,
+            Warranty_Claim_Accepted=WARRANTY_LABELS[claim_accepted],
+        )
+        batch_results.insert(0, "Source", source)
+        batch_results.insert(1, "CSV_Row", batch_input.index + 1 if source == "csv" else None)
+        batch_results.to_csv(output, index=False, header=output.tell() == 0)
+    return output.getvalue()
 
 # --------------------------
 # Tabs for Navigation
@@ -108,102 +261,106 @@ with tab1:
 
     if uploaded_file:
         try:
-            csv_data = pd.read_csv(uploaded_file)
+            # Only the preview is read here; TAB 2 streams the full file in chunks
+            csv_preview = read_feature_csv(uploaded_file, nrows=5)
             st.success("✅ CSV Loaded Successfully")
-            st.dataframe(csv_data.head())
+            st.dataframe(csv_preview)
+            csv_file = uploaded_file
         except Exception as e:
             st.error(f"❌ Error reading CSV: {e}")
-            csv_data = None
+            csv_file = None
     else:
-        csv_data = None
+        csv_file = None
 
 # --------------------------
 # TAB 2: Predictions
 # --------------------------
 with tab2:
     st.header("🔮 Predict Maintenance Needs")
+    # Stored predictions are cleared as soon as the inputs they were computed from change
+    prediction_inputs = (manual_row, csv_file.file_id if csv_file is not None else None)
+    if st.session_state.get("prediction_inputs") != prediction_inputs:
+        st.session_state.pop("prediction", None)
+
     if st.button("🚀 Run Prediction"):
         if rul_model and failure_model:
             try:
-                input_data = pd.concat([manual_input, csv_data], ignore_index=True) if csv_data is not None else manual_input
-
-                rul_predictions = rul_model.predict(input_data)
-                failure_predictions = failure_model.predict_proba(input_data)[:, 1]
-
-                results = input_data.copy()
-                results["RUL_days"] = rul_predictions
-                results["Failure_Probability"] = failure_predictions
-                results["Vehicle_Health"] = 1 - failure_predictions
-                results["Warranty_Claim_Accepted"] = results.apply(
-                    lambda row: "✅ Accepted" if (row["RUL_days"] < 180 or row["Failure_Probability"] > 0.5)
-                    else "❌ Rejected", axis=1
-                )
-
-                st.dataframe(results[["RUL_days", "Failure_Probability", "Vehicle_Health", "Warranty_Claim_Accepted"]])
-
-                avg_rul = rul_predictions.mean()
-                avg_failure = failure_predictions.mean()
-
-                col1, col2 = st.columns(2)
-                col1.metric("🕒 Avg Remaining Useful Life (days)", f"{int(avg_rul)}")
-                col2.metric("⚠️ Avg Failure Probability", f"{avg_failure*100:.1f}%")
-
-                st.markdown("### 🛠️ Recommended Maintenance")
-                st.write(f"- Next **battery health check**: {int(avg_rul/3)} days")
-                st.write(f"- **Brake service**: {int(avg_rul/2)} days")
-                st.write(f"- **Tire rotation**: {int(distance_traveled/1000)} km")
-                st.write(f"- **Cooling system inspection**: {int(avg_rul/4)} days")
-                st.write(f"- **Motor vibration check**: {int(avg_rul/5)} days")
-
-                fig = px.bar(
-                    x=["Battery", "Brakes", "Tires", "Motor", "Cooling"],
-                    y=[avg_rul/3, avg_rul/2, distance_traveled/1000, avg_rul/4, avg_rul/5],
-                    labels={"x": "Component", "y": "Days to Service"},
-                    color=["Battery", "Brakes", "Tires", "Motor", "Cooling"],
-                    color_discrete_sequence=px.colors.qualitative.Set2
-                )
-                st.plotly_chart(fig, use_container_width=True)
-
+                results, avg_rul, avg_failure = predict_results(manual_input, csv_file)
+
+                # Keep only the preview and summary stats across reruns; release the full table now
+                st.session_state.prediction = {
+                    "preview": results.head(PREVIEW_ROWS).copy(),
+                    "rows": len(results),
+                    "avg_rul": avg_rul,
+                    "avg_failure": avg_failure,
+                }
+                st.session_state.prediction_inputs = prediction_inputs
+                del results
+                gc.collect()
             except Exception as e:
                 st.error(f"❌ Error during prediction: {e}")
 
+    prediction = st.session_state.get("prediction")
+    if prediction is not None:
+        avg_rul = prediction["avg_rul"]
+        avg_failure = prediction["avg_failure"]
+
+        st.dataframe(prediction["preview"])
+        if prediction["rows"] > PREVIEW_ROWS:
+            st.caption(f"Showing the first {PREVIEW_ROWS} of {prediction['rows']} rows.")
+        # Deferred: the full table is only rebuilt when the button is clicked
+        st.download_button("⬇️ Download full results", partial(results_csv, *prediction_inputs, manual_input.copy(), csv_file), "results.csv", mime="text/csv")
+
+        col1, col2 = st.columns(2)
+        col1.metric("🕒 Avg Remaining Useful Life (days)", f"{int(avg_rul)}")
+        col2.metric("⚠️ Avg Failure Probability", f"{avg_failure*100:.1f}%")
+
+        st.markdown("### 🛠️ Recommended Maintenance")
+        st.write(f"- Next **battery health check**: {int(avg_rul/3)} days")
+        st.write(f"- **Brake service**: {int(avg_rul/2)} days")
+        st.write(f"- **Tire rotation**: {int(distance_traveled/1000)} km")
+        st.write(f"- **Cooling system inspection**: {int(avg_rul/4)} days")
+        st.write(f"- **Motor vibration check**: {int(avg_rul/5)} days")
+
+        service_days = np.where(DIVISORS > 0, avg_rul / np.where(DIVISORS == 0, 1, DIVISORS), distance_traveled/1000)
+        fig = px.bar(
+            x=COMPONENTS,
+            y=service_days,
+            labels={"x": "Component", "y": "Days to Service"},
+            color=COMPONENTS,
+            color_discrete_sequence=px.colors.qualitative.Set2
+        )
+        st.plotly_chart(fig, use_container_width=True)
+
 # --------------------------
 # TAB 3: Live Sensor Console
 # --------------------------
+# Only this fragment reruns every 2s, so the rest of the page (including prediction results) stays put
+@st.fragment(run_every="2s")
+def live_sensor_console():
+    sensor_data = dict(zip(SENSOR_KEYS, rng.uniform(SENSOR_LOWS, SENSOR_HIGHS)))
+
+    live_df = pd.DataFrame(sensor_data, index=[0])
+    st.metric("🔋 Battery Voltage (V)", f"{sensor_data['Battery_Voltage']:.2f}")
+    st.metric("⚡ Battery Current (A)", f"{sensor_data['Battery_Current']:.2f}")
+    st.metric("🌡️ Battery Temperature (°C)", f"{sensor_data['Battery_Temperature']:.2f}")
+    st.metric("⚙️ Motor Temperature (°C)", f"{sensor_data['Motor_Temperature']:.2f}")
+    st.metric("🛠️ Motor Vibration", f"{sensor_data['Motor_Vibration']:.2f}")
+    st.metric("🛑 Brake Pad Wear (%)", f"{sensor_data['Brake_Pad_Wear']*100:.1f}")
+    st.metric("🛞 Tire Pressure (PSI)", f"{sensor_data['Tire_Pressure']:.1f}")
+    st.metric("🌡️ Ambient Temp (°C)", f"{sensor_data['Ambient_Temperature']:.1f}")
+
+    chart = px.line(live_df.T, title="📈 Live Sensor Trends", markers=True)
+    st.plotly_chart(chart, use_container_width=True)
+
 with tab3:
     st.header("📡 Live Sensor Data Console")
 
     st.write("Monitor live EV sensor readings in real time. (Currently simulating values.)")
 
-    placeholder = st.empty()
     start = st.checkbox("▶️ Start Live Monitoring")
 
-    while start:
-        sensor_data = {
-            "Battery_Voltage": random.uniform(380, 420),
-            "Battery_Current": random.uniform(-50, 50),
-            "Battery_Temperature": random.uniform(25, 40),
-            "Motor_Temperature": random.uniform(50, 90),
-            "Motor_Vibration": random.uniform(0.1, 2.0),
-            "Brake_Pad_Wear": random.uniform(0.1, 0.9),
-            "Tire_Pressure": random.uniform(28, 36),
-            "Ambient_Temperature": random.uniform(20, 35),
-        }
-
-        live_df = pd.DataFrame(sensor_data, index=[0])
-        with placeholder.container():
-            st.metric("🔋 Battery Voltage (V)", f"{sensor_data['Battery_Voltage']:.2f}")
-            st.metric("⚡ Battery Current (A)", f"{sensor_data['Battery_Current']:.2f}")
-            st.metric("🌡️ Battery Temperature (°C)", f"{sensor_data['Battery_Temperature']:.2f}")
-            st.metric("⚙️ Motor Temperature (°C)", f"{sensor_data['Motor_Temperature']:.2f}")
-            st.metric("🛠️ Motor Vibration", f"{sensor_data['Motor_Vibration']:.2f}")
-            st.metric("🛑 Brake Pad Wear (%)", f"{sensor_data['Brake_Pad_Wear']*100:.1f}")
-            st.metric("🛞 Tire Pressure (PSI)", f"{sensor_data['Tire_Pressure']:.1f}")
-            st.metric("🌡️ Ambient Temp (°C)", f"{sensor_data['Ambient_Temperature']:.1f}")
-
-            chart = px.line(live_df.T, title="📈 Live Sensor Trends", markers=True)
-            st.plotly_chart(chart, use_container_width=True)
-
-        time.sleep(2)
+    if start:
+        live_sensor_console()
 
 
@@ -0,0 +1,29 @@
+import numpy as np
+
+# --------------------------
+# Warranty Decision Kernel
+# --------------------------
+# Kept out of the Streamlit script so the compiled kernel is imported once per
+# process instead of being rebuilt on every rerun.
+#
+# A claim is accepted when RUL < 180 days or failure probability > 0.5. The
+# decision and both means are fused into one pass with Numba when it is installed.
+# The kernel is serial: Streamlit runs scripts off the main thread, where Numba's
+# parallel threading layers can deadlock, and XGBoost already uses the cores.
+try:
+    from numba import njit
+
+    @njit(cache=True)
+    def decide_warranty(rul, failure):
+        claim_accepted = np.empty(rul.size, np.uint8)
+        rul_total = 0.0
+        failure_total = 0.0
+        for i in range(rul.size):
+            claim_accepted[i] = (rul[i] < 180) | (failure[i] > 0.5)
+            rul_total += rul[i]
+            failure_total += failure[i]
+        return claim_accepted, rul_total / rul.size, failure_total / rul.size
+except ImportError:
+    def decide_warranty(rul, failure):
+        claim_accepted = ((rul < 180) | (failure > 0.5)).astype(np.uint8)
+        return claim_accepted, rul.mean(), failure.mean()